@@ -0,0 +1,3 @@
+from .config import Config
+from .engine import Engine, EventSource, ImageStatus
+from .state import FileStateStorage, ImageHistory, MemoryStateStorage, State, StateStorage
@@ -1,93 +1,40 @@
 import argparse
 import asyncio
 import logging
+import re
 import sys
 from argparse import ArgumentParser
-from datetime import datetime, timedelta
+from datetime import timedelta
 
 import colorama
 import pytimeparse
 import sdnotify
-import yaml
-from croniter import croniter
 
 from . import config as config_mod
-from . import dockerapi
-from . import state as state_mod
-from .base import process_event, sweep
-from .config import Config
-from .daemon import install_daemon
+from . import simulate as simulate_mod
+from .daemon import IO_SCHEDULING_CLASSES, install_daemon
+from .engine import Engine
 from .feedback import init_logging
-from .state import State
+from .state import FileStateStorage
 
 logger = logging.getLogger("docker_housekeep")
 systemd_notifier = sdnotify.SystemdNotifier()
 
 
-async def async_iterate(sync_iterable):
-    """Convert a syncronized iterable into an async one.
-
-    Taken from https://stackoverflow.com/q/76991812
-    """
-    # to_thread errors if StopIteration raised in it. So we use a sentinel to detect the end
-    done_sentinel = object()
-    it = iter(sync_iterable)
-    while (value := await asyncio.to_thread(next, it, done_sentinel)) is not done_sentinel:
-        yield value
-
-
-async def handle_events(state: State, state_fd):
-    events = dockerapi.get_events(since=state.timestamp or datetime.fromtimestamp(0))
-    logger.info("watching docker events")
-
-    async for event in async_iterate(events):
-        process_event(event, state)
-
-        state_fd.seek(0)
-        state_mod.dump(state, state_fd)
-        state_fd.truncate()
-
-
-async def periodic_sweep(config: Config, state: State):
-    while True:
-        now = datetime.now()
-        sweep_time = croniter(config.sweep_schedule, start_time=now).get_next(ret_type=datetime)
-        logger.info("scheduled next sweep for %s", sweep_time.strftime("%Y-%m-%d %H:%M:%S"))
-        await asyncio.sleep((sweep_time - now).total_seconds())
-        sweep(state, config.max_age)
-
-
-async def watch(*, config: Config, state: State, state_fd, do_sweep=True):
-    async with asyncio.TaskGroup() as group:
-        group.create_task(handle_events(state, state_fd))
-
-        if do_sweep:
-            group.create_task(periodic_sweep(config, state))
-
-        systemd_notifier.notify("READY=1")
-
-
-class UpdateOrCreateFile(argparse.FileType):
-    """Special argparse file type, a combination of x+ and r+.
-
-    - Opens file for reading and writing;
-    - Seek position is at the beginning;
-    - Creates the file if it does not exist.
-    """
+def state_file_argument(string: str):
+    """Open a state file for reading and writing, creating it if it does not exist."""
+    try:
+        return FileStateStorage.open(string)
+    except OSError as e:
+        raise argparse.ArgumentTypeError(f"can't open '{string}': {e}")
 
-    def __init__(self, *args, **kwargs) -> None:
-        super().__init__(*args, mode="r+", **kwargs)
 
-    def __call__(self, string: str):
-        try:
-            try:
-                return open(string, "x+", self._bufsize, self._encoding, self._errors)
-            except FileExistsError:
-                fd = open(string, "r+", self._bufsize, self._encoding, self._errors)
-                fd.seek(0)
-                return fd
-        except OSError as e:
-            raise argparse.ArgumentTypeError(f"can't open '{string}': {e}")
+def existing_state_file_argument(string: str):
+    """Open an existing state file for reading and writing."""
+    try:
+        return FileStateStorage.open(string, create=False)
+    except OSError as e:
+        raise argparse.ArgumentTypeError(f"can't open '{string}': {e}")
 
 
 from io import BytesIO, StringIO
@@ -128,6 +75,36 @@ def validate_timedelta_argument(string: str):
     return string
 
 
+def weight_argument(string: str):
+    try:
+        weight = int(string)
+    except ValueError:
+        weight = 0
+
+    if not 1 <= weight <= 10000:
+        raise argparse.ArgumentTypeError(f"expected a weight between 1 and 10000, got '{string}'")
+
+    return weight
+
+
+def watchdog_argument(string: str):
+    watchdog = timedelta_argument(string)
+    if watchdog <= timedelta(0):
+        raise argparse.ArgumentTypeError(f"expected a positive time duration, got '{string}'")
+
+    return watchdog
+
+
+def memory_max_argument(string: str):
+    """Validate a value of systemd's MemoryMax=: a size with an optional K/M/G/T suffix, a percentage or "infinity"."""
+    if not re.fullmatch(r"\d+[KMGT]?|\d+(\.\d+)?%|infinity", string):
+        raise argparse.ArgumentTypeError(
+            f"expected a size like '256M', a percentage like '10%', or 'infinity', got '{string}'"
+        )
+
+    return string
+
+
 def cli():
     # Shared arguments between subcommands
     def add_argument_verbosity(p):
@@ -171,13 +148,43 @@ def cli():
         default=True,
         help="start the service and enable it at startup (default: on)",
     )
+    daemon_install_parser.add_argument(
+        "--watchdog-sec",
+        type=watchdog_argument,
+        default="3m",
+        help="restart the service if it stops responding for this long (default: 3m)",
+    )
+    daemon_install_parser.add_argument(
+        "--memory-max",
+        type=memory_max_argument,
+        default="256M",
+        help="systemd MemoryMax= limit of the service (default: 256M)",
+    )
+    daemon_install_parser.add_argument(
+        "--cpu-weight",
+        type=weight_argument,
+        default=20,
+        help="systemd CPUWeight= of the service, 1-10000 where 100 is the system default (default: 20)",
+    )
+    daemon_install_parser.add_argument(
+        "--io-weight",
+        type=weight_argument,
+        default=10,
+        help="systemd IOWeight= of the service, 1-10000 where 100 is the system default (default: 10)",
+    )
+    daemon_install_parser.add_argument(
+        "--io-scheduling-class",
+        choices=IO_SCHEDULING_CLASSES,
+        default="idle",
+        help="systemd IOSchedulingClass= of the service (default: idle)",
+    )
 
     watch_parser = subcommands.add_parser(
         "watch",
         help="launch a long-running process monitoring events from docker; optionally clean up according to schedule",
     )
     watch_parser.add_argument(
-        "--state-file", type=UpdateOrCreateFile(encoding="utf-8"), default="state.json", help=state_file_help
+        "--state-file", type=state_file_argument, default="state.json", help=state_file_help
     )
     add_argument_config(watch_parser)
     watch_parser.add_argument(
@@ -186,15 +193,38 @@ def cli():
         default=True,
         help="while watching, perform image cleanup according to schedule (default: on)",
     )
+    watch_parser.add_argument(
+        "--record-events",
+        type=argparse.FileType("a", encoding="utf-8"),
+        metavar="PATH",
+        help="append received events to an event log, which can be replayed with the 'simulate' command",
+    )
     add_argument_verbosity(watch_parser)
 
     sweep_parser = subcommands.add_parser("sweep", help="perform an immediate one-time image cleanup")
     sweep_parser.add_argument(
-        "--state-file", type=argparse.FileType("r", encoding="utf-8"), default="state.json", help=state_file_help
+        "--state-file", type=existing_state_file_argument, default="state.json", help=state_file_help
     )
     add_argument_config(sweep_parser)
     add_argument_verbosity(sweep_parser)
 
+    simulate_parser = subcommands.add_parser(
+        "simulate", help="replay a recorded event log and compare eviction policies by the amount of re-pulled data"
+    )
+    simulate_parser.add_argument(
+        "events",
+        type=argparse.FileType("r", encoding="utf-8"),
+        help="event log recorded with 'watch --record-events'",
+    )
+    simulate_parser.add_argument(
+        "--policy",
+        action="append",
+        choices=config_mod.EVICTION_POLICIES,
+        help="eviction policy to simulate; can be specified multiple times (default: all policies)",
+    )
+    add_argument_config(simulate_parser)
+    add_argument_verbosity(simulate_parser)
+
     return parser
 
 
@@ -217,23 +247,44 @@ def main():
 
     if args.subcommand == "daemon":
         if args.daemon_subcommand == "install":
-            install_daemon(enable=args.enable)
+            install_daemon(
+                enable=args.enable,
+                watchdog_sec=args.watchdog_sec,
+                memory_max=args.memory_max,
+                cpu_weight=args.cpu_weight,
+                io_weight=args.io_weight,
+                io_scheduling_class=args.io_scheduling_class,
+            )
         else:
             raise RuntimeError("unhandled subcommand of 'daemon'")
     elif args.subcommand == "watch":
         init_logging(verbose=args.verbose, timestamps=args.log_timestamps)
 
         config = load_config(args.config)
-        state = state_mod.load(args.state_file)
+        engine = Engine(
+            config,
+            storage=args.state_file,
+            notifier=systemd_notifier,
+            schedule_sweeps=args.sweep,
+            record_fd=args.record_events,
+        )
 
-        asyncio.run(watch(config=config, state=state, state_fd=args.state_file, do_sweep=args.sweep))
+        asyncio.run(engine.run())
     elif args.subcommand == "sweep":
         init_logging(verbose=args.verbose, timestamps=args.log_timestamps)
 
         config = load_config(args.config)
-        state = state_mod.load(args.state_file)
+        engine = Engine(config, storage=args.state_file, schedule_sweeps=False)
+
+        asyncio.run(engine.sweep())
+    elif args.subcommand == "simulate":
+        init_logging(verbose=args.verbose, timestamps=args.log_timestamps)
+
+        config = load_config(args.config)
+        records = simulate_mod.load_records(args.events)
 
-        sweep(state, config.max_age)
+        policies = args.policy or config_mod.EVICTION_POLICIES
+        simulate_mod.report([simulate_mod.simulate(records, config, policy) for policy in policies])
     else:
         raise RuntimeError("unhandled subcommand")
 
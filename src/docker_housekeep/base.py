@@ -1,14 +1,20 @@
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 
 import requests
 import yaml
 
 from . import dockerapi
+from . import policy as policy_mod
+from . import state as state_mod
+from .config import Config
 from .state import State
 
 logger = logging.getLogger("docker_housekeep")
 
+# History of deleted images is forgotten once it has decayed this many half-lives, at which point it weighs under 1%
+FORGET_AFTER_HALF_LIVES = 8
+
 
 def fromtimestamp(timestamp: int) -> datetime:
     """Convert a docker event timestamp into a datetime object."""
@@ -25,49 +31,208 @@ def update_state(state: State, id: str, time: datetime | None):
             del state.last_used[id]
             logger.info("remove entry: %s", id)
         except KeyError:
-            logger.warning("remove failed, missing entry for: %s", id)
-
+            # Images deleted by a sweep are removed right away, before docker reports the deletion
+            logger.debug("remove skipped, missing entry for: %s", id)
 
-def process_event(event: dict, state: State):
-    logger.debug("received docker event\n%s", yaml.dump(event).rstrip())
-    state.timestamp = fromtimestamp(event["time"])
 
+def event_image(event: dict) -> str | None:
+    """Return the ID of the image used or deleted by a docker event, or None if the event is irrelevant."""
     if event["Type"] == "image" and event["Action"] in {"save", "tag", "untag", "delete"}:
         # Out of all actions: delete, import, load, pull, push, save, tag, untag
         # We do not consider import, load, pull because they are followed by the "save" event
         # We also do not consider "push" as an action that uses the image.
+        return event["id"]
 
-        if event["Action"] == "delete":
-            update_state(state, event["id"], None)
-        else:
-            update_state(state, event["id"], fromtimestamp(event["time"]))
-    elif event["Type"] == "container" and (
+    if event["Type"] == "container" and (
         event["Action"].startswith("create") or event["Action"].startswith("exec_create")
     ):
         container = dockerapi.get_container(event["id"])
         if container is not None:
-            update_state(state, container["Image"], fromtimestamp(event["time"]))
+            return container["Image"]
+
+    return None
+
+
+def image_size(id: str) -> int | None:
+    image = dockerapi.get_image(id)
+    if image is None:
+        return None
+    return image["Size"]
+
+
+def is_use(event: dict) -> bool:
+    """Whether a docker event that concerns an image (see `event_image`) counts as a use of that image."""
+    if event["Type"] == "image":
+        # "untag" precedes every deletion, so it says nothing about how often the image is needed
+        return event["Action"] in {"save", "tag"}
+    return event["Type"] == "container"
+
+
+def apply_event(event: dict, state: State, image: str | None, size: int | None = None):
+    """Record a docker event in `state`, given the image it concerns (see `event_image`) and optionally that image's
+    size. Does not contact docker, so it can also be used to replay recorded events.
+    """
+    state.timestamp = fromtimestamp(event["time"])
+    if image is None:
+        return
+
+    if event["Type"] == "image" and event["Action"] == "delete":
+        # Usage history is kept after deletion: if the image is pulled again, that is a re-pull
+        update_state(state, image, None)
+        return
+
+    time = fromtimestamp(event["time"])
+    update_state(state, image, time)
+    if not is_use(event):
+        return
+
+    history = state.history_of(image)
+    history.add_use(time)
+    if event["Type"] == "image" and event["Action"] == "save":
+        history.add_pull(time)
+    if size is not None:
+        history.size = size
+
+
+def resolve_event(event: dict, state: State) -> tuple:
+    """Find the image that a docker event concerns, and its size if `state` needs it. Does not modify `state`."""
+    logger.debug("received docker event\n%s", yaml.dump(event).rstrip())
+
+    image = event_image(event)
+    size = None
+    if image is not None and event["Action"] != "delete":
+        # Size only changes when an image is (re)written, so avoid inspecting it for every container
+        history = state.history.get(image)
+        if (event["Type"] == "image" and event["Action"] == "save") or history is None or history.size is None:
+            size = image_size(image)
+
+    return image, size
+
+
+def select_images(state: State, config: Config, now: datetime) -> list:
+    """Return IDs of images that a sweep at time `now` should delete."""
+    return policy_mod.from_config(config).select(state, now)
+
+
+def delete_image(image: str) -> bool:
+    """Delete an image, logging the reason if docker refuses to. Returns whether the image was deleted."""
+    logger.info("deleting: %s", image)
+
+    try:
+        response = dockerapi.delete_image(image)
+        logger.debug(yaml.dump(response).rstrip())
+        return True
+    except requests.HTTPError as e:
+        status = e.response.status_code
+        data = e.response.json()
 
+        logger.debug("delete error %s: %s", status, data["message"])
 
-def sweep(state: State, max_age: timedelta):
-    cutoff = datetime.now().astimezone() - max_age
+        if status == 404:
+            logger.warning("cannot delete %s: no such image", image)
+        elif status == 409:
+            logger.error("cannot delete %s: %s", image, data["message"])
+        else:
+            raise
+
+    return False
+
+
+def remove_stale_containers(config: Config, now: datetime) -> int:
+    """Remove stopped containers that exited longer than `container-max-age` ago and match `container-labels`.
+
+    Containers are removed in bulk with /containers/prune when its filters select exactly the stale containers, and one
+    by one otherwise. Returns the number of removed containers.
+    """
+    cutoff = now - config.container_max_age
+
+    # Everything that prune would remove, to tell whether it would remove anything besides stale containers
+    filters = {"status": ["created", "exited", "dead"]}
+    if config.container_labels:
+        filters["label"] = config.container_labels
+
+    stale = []
+    can_prune = True
+    for container in dockerapi.get_containers(all=True, filters=filters):
+        # Prune filters by creation time, which is never later than the time the container exited
+        if fromtimestamp(container["Created"]) >= cutoff:
+            continue
+
+        # Containers that were only created (like data volume holders) or are dead never count as stale
+        if container["State"] != "exited":
+            can_prune = False
+            continue
+
+        details = dockerapi.get_container(container["Id"])
+        if details is None:
+            continue
+
+        if datetime.fromisoformat(details["State"]["FinishedAt"]) < cutoff:
+            stale.append(container["Id"])
+        else:
+            can_prune = False
+
+    if not stale:
+        return 0
+
+    if can_prune:
+        prune_filters = {"until": [str(int(cutoff.timestamp()))]}
+        if config.container_labels:
+            prune_filters["label"] = config.container_labels
 
-    for image, last_used in state.last_used.items():
-        if last_used < cutoff:
-            logger.info("deleting: %s", image)
+        response = dockerapi.prune_containers(filters=prune_filters)
+        removed = len(response["ContainersDeleted"] or [])
+        logger.info("pruned %d stopped containers, reclaimed %d bytes", removed, response["SpaceReclaimed"])
+        return removed
+
+    removed = 0
+    for id in stale:
+        try:
+            dockerapi.delete_container(id)
+            removed += 1
+        except requests.HTTPError as e:
+            logger.warning("cannot remove container %s: %s", id, e.response.json()["message"])
+
+    logger.info("removed %d stopped containers", removed)
+    return removed
+
+
+def images_in_use() -> set:
+    """Return IDs and names of all images that have containers, running or not."""
+    result = set()
+    for container in dockerapi.get_containers(all=True):
+        result.add(container["ImageID"])
+        result.add(container["Image"])
+    return result
+
+
+def unblock_images(images: list, config: Config, now: datetime) -> list:
+    """Prepare images selected for deletion, returning the ones that can be deleted.
+
+    If `container-cleanup` is enabled, stale stopped containers are removed first. Images that still have containers
+    are skipped, since docker would refuse to delete them anyway.
+    """
+    if not images:
+        return images
+
+    in_use = images_in_use()
+
+    if config.container_cleanup and remove_stale_containers(config, now) > 0:
+        blocked = in_use
+        in_use = images_in_use()
+
+        unblocked = sum(1 for image in images if image in blocked and image not in in_use)
+        logger.info("container cleanup unblocked %d images", unblocked)
+
+    result = []
+    for image in images:
+        if image in in_use:
+            logger.info("keeping %s: used by a container", image)
+        else:
+            result.append(image)
 
-            try:
-                response = dockerapi.delete_image(image)
-                logger.debug(yaml.dump(response).rstrip())
-            except requests.HTTPError as e:
-                status = e.response.status_code
-                data = e.response.json()
+    return result
 
-                logger.debug("delete error %s: %s", status, data["message"])
 
-                if status == 404:
-                    logger.warning("cannot delete %s: no such image", image)
-                elif status == 409:
-                    logger.error("cannot delete %s: %s", image, data["message"])
-                else:
-                    raise
+def finish_sweep(state: State, config: Config, now: datetime):
+    state_mod.forget(state, now - config.frequency_half_life * FORGET_AFTER_HALF_LIVES)
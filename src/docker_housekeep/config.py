@@ -1,3 +1,4 @@
+import re
 from dataclasses import dataclass
 from datetime import timedelta
 
@@ -5,13 +6,73 @@ import pytimeparse
 import yaml
 from croniter import croniter
 
+EVICTION_POLICIES = ("age", "cost")
+
+SIZE_UNITS = {
+    "": 1,
+    "B": 1,
+    "KB": 1000,
+    "MB": 1000**2,
+    "GB": 1000**3,
+    "TB": 1000**4,
+    "KIB": 1024,
+    "MIB": 1024**2,
+    "GIB": 1024**3,
+    "TIB": 1024**4,
+}
+
+
+def parse_size(string: str) -> int | None:
+    """Parse a size like "1.5GB" or "512MiB" into bytes. Return None if the string is not understood."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*", string)
+    if match is None or match[2].upper() not in SIZE_UNITS:
+        return None
+
+    return int(float(match[1]) * SIZE_UNITS[match[2].upper()])
+
+
+def format_size(size: int) -> str:
+    """Format a size in bytes using the largest decimal unit that represents it exactly."""
+    for unit in ("TB", "GB", "MB", "KB"):
+        if size != 0 and size % SIZE_UNITS[unit] == 0:
+            return f"{size // SIZE_UNITS[unit]}{unit}"
+    return f"{size}B"
+
+
+def parse_timedelta(value: timedelta | str, field: str) -> timedelta:
+    if isinstance(value, timedelta):
+        return value
+
+    seconds = pytimeparse.parse(value)
+    if seconds is None:
+        raise ValueError(
+            f"invalid value '{value}' for config field '{field}'. Expected a qualified time duration, like '3d12h'."
+        )
+    return timedelta(seconds=seconds)
+
 
 @dataclass
 class Config:
     sweep_schedule: str
     max_age: timedelta
-
-    def __init__(self, sweep_schedule: str, max_age: timedelta | str):
+    eviction_policy: str
+    frequency_half_life: timedelta
+    reference_size: int
+    container_cleanup: bool
+    container_max_age: timedelta
+    container_labels: list
+
+    def __init__(
+        self,
+        sweep_schedule: str,
+        max_age: timedelta | str,
+        eviction_policy: str = "age",
+        frequency_half_life: timedelta | str = "4w",
+        reference_size: int | str = "1GB",
+        container_cleanup: bool = False,
+        container_max_age: timedelta | str = "1w",
+        container_labels: list | None = None,
+    ):
         if not croniter.is_valid(sweep_schedule):
             raise ValueError(
                 f"invalid value '{sweep_schedule}' for config field 'sweep-shedule'. "
@@ -19,30 +80,78 @@ class Config:
             )
         self.sweep_schedule = sweep_schedule
 
-        if isinstance(max_age, timedelta):
-            self.max_age = max_age
+        self.max_age = parse_timedelta(max_age, "max-age")
+
+        if eviction_policy not in EVICTION_POLICIES:
+            raise ValueError(
+                f"invalid value '{eviction_policy}' for config field 'eviction-policy'. "
+                f"Expected one of: {', '.join(EVICTION_POLICIES)}."
+            )
+        self.eviction_policy = eviction_policy
+
+        self.frequency_half_life = parse_timedelta(frequency_half_life, "frequency-half-life")
+        if self.frequency_half_life <= timedelta(0):
+            raise ValueError("config field 'frequency-half-life' must be a positive duration.")
+
+        if isinstance(reference_size, int):
+            self.reference_size = reference_size
         else:
-            max_age_seconds = pytimeparse.parse(max_age)
-            if max_age_seconds is None:
+            self.reference_size = parse_size(str(reference_size))
+            if self.reference_size is None:
                 raise ValueError(
-                    f"invalid value '{max_age}' for config field 'max-age'. "
-                    "Expected a qualified time duration, like '3d12h'."
+                    f"invalid value '{reference_size}' for config field 'reference-size'. "
+                    "Expected a size in bytes, like '1GB' or '512MiB'."
                 )
-            self.max_age = timedelta(seconds=max_age_seconds)
+        if self.reference_size <= 0:
+            raise ValueError("config field 'reference-size' must be a positive size.")
+
+        if not isinstance(container_cleanup, bool):
+            raise ValueError(
+                f"invalid value '{container_cleanup}' for config field 'container-cleanup'. Expected true or false."
+            )
+        self.container_cleanup = container_cleanup
+
+        self.container_max_age = parse_timedelta(container_max_age, "container-max-age")
+
+        container_labels = container_labels or []
+        if not isinstance(container_labels, list) or not all(isinstance(label, str) for label in container_labels):
+            raise ValueError(
+                f"invalid value '{container_labels}' for config field 'container-labels'. "
+                "Expected a list of labels, like ['ci', 'owner=build-agent']."
+            )
+        self.container_labels = container_labels
 
 
 default_config = Config(sweep_schedule="0 6 * * *", max_age="1w")
 
 
 def load(fd):
-    data = yaml.safe_load(fd)
-    data |= dump_dict(default_config)  # Fill in missing fields
+    data = yaml.safe_load(fd) or {}
+    data = dump_dict(default_config) | data  # Fill in missing fields
 
     return load_dict(data)
 
 
+def load_path(path) -> Config:
+    """Load configuration from a file at `path`, or return the default configuration if there is no such file."""
+    try:
+        with open(path, encoding="utf-8") as fd:
+            return load(fd)
+    except FileNotFoundError:
+        return default_config
+
+
 def load_dict(data: dict):
-    return Config(sweep_schedule=data["sweep-schedule"], max_age=data["max-age"])
+    return Config(
+        sweep_schedule=data["sweep-schedule"],
+        max_age=data["max-age"],
+        eviction_policy=data["eviction-policy"],
+        frequency_half_life=data["frequency-half-life"],
+        reference_size=data["reference-size"],
+        container_cleanup=data["container-cleanup"],
+        container_max_age=data["container-max-age"],
+        container_labels=data["container-labels"],
+    )
 
 
 def dumps(config: Config):
@@ -50,4 +159,13 @@ def dumps(config: Config):
 
 
 def dump_dict(config: Config):
-    return {"sweep-schedule": config.sweep_schedule, "max-age": str(config.max_age)}
+    return {
+        "sweep-schedule": config.sweep_schedule,
+        "max-age": str(config.max_age),
+        "eviction-policy": config.eviction_policy,
+        "frequency-half-life": str(config.frequency_half_life),
+        "reference-size": format_size(config.reference_size),
+        "container-cleanup": config.container_cleanup,
+        "container-max-age": str(config.container_max_age),
+        "container-labels": config.container_labels,
+    }
@@ -1,9 +1,19 @@
+import asyncio
 import logging
+import math
+import os
 import shlex
 import sys
+import time
+from datetime import datetime, timedelta
 from pathlib import Path
 from subprocess import run
 
+import requests
+import sdnotify
+
+from . import dockerapi
+
 logger = logging.getLogger("docker_housekeep")
 
 SYSTEMD_SERVICE_TEMPLATE = """\
@@ -14,13 +24,58 @@ After=docker.service
 [Service]
 Type=notify
 ExecStart={executable} watch --state-file /var/lib/docker-housekeep/state.json
+Restart=on-failure
+WatchdogSec={watchdog_sec}
+
+# Stay out of the way of production workloads
+MemoryMax={memory_max}
+CPUWeight={cpu_weight}
+IOWeight={io_weight}
+IOSchedulingClass={io_scheduling_class}
 
 [Install]
 WantedBy=multi-user.target
 """
 
+IO_SCHEDULING_CLASSES = ("idle", "best-effort", "realtime")
+
+# How often STATUS= is sent to systemd when the watchdog is disabled
+STATUS_INTERVAL = timedelta(seconds=30)
+
+# How long an event may take to arrive through the event stream before the stream is considered stalled
+STREAM_GRACE = timedelta(seconds=10)
+
 
-def install_daemon(*, enable=True):
+def render_service(
+    executable: Path,
+    *,
+    watchdog_sec: timedelta,
+    memory_max: str,
+    cpu_weight: int,
+    io_weight: int,
+    io_scheduling_class: str,
+) -> str:
+    """Render the systemd unit file of the service."""
+    return SYSTEMD_SERVICE_TEMPLATE.format(
+        executable=shlex.quote(str(executable)),
+        # Rounded up, because WatchdogSec=0 disables the watchdog
+        watchdog_sec=math.ceil(watchdog_sec.total_seconds()),
+        memory_max=memory_max,
+        cpu_weight=cpu_weight,
+        io_weight=io_weight,
+        io_scheduling_class=io_scheduling_class,
+    )
+
+
+def install_daemon(
+    *,
+    enable=True,
+    watchdog_sec: timedelta = timedelta(minutes=3),
+    memory_max: str = "256M",
+    cpu_weight: int = 20,
+    io_weight: int = 10,
+    io_scheduling_class: str = "idle",
+):
     # Find the docker-housekeep executable
     executable_path = Path(sys.executable).parent / "docker-housekeep"
     if not executable_path.exists():
@@ -35,11 +90,156 @@ def install_daemon(*, enable=True):
     Path("/var/lib/docker-housekeep").mkdir(parents=True, exist_ok=True)
 
     with open("/etc/systemd/system/docker-housekeep.service", "w", encoding="utf-8") as fd:
-        fd.write(SYSTEMD_SERVICE_TEMPLATE.format(executable=shlex.quote(str(executable_path))))
+        fd.write(
+            render_service(
+                executable_path,
+                watchdog_sec=watchdog_sec,
+                memory_max=memory_max,
+                cpu_weight=cpu_weight,
+                io_weight=io_weight,
+                io_scheduling_class=io_scheduling_class,
+            )
+        )
 
     logger.info("daemon installed at /etc/systemd/system/docker-housekeep.service")
 
     if enable:
+        run(["systemctl", "daemon-reload"], check=True)
         run(["systemctl", "enable", "docker-housekeep.service"], check=True)
-        run(["systemctl", "start", "docker-housekeep.service"], check=True)
+        run(["systemctl", "restart", "docker-housekeep.service"], check=True)
         logger.info("daemon started")
+
+
+def watchdog_interval() -> timedelta | None:
+    """Return how often systemd expects a watchdog heartbeat, or None if the watchdog is disabled."""
+    usec = os.environ.get("WATCHDOG_USEC")
+    if usec is None:
+        return None
+
+    pid = os.environ.get("WATCHDOG_PID")
+    if pid is not None and int(pid) != os.getpid():
+        return None
+
+    return timedelta(microseconds=int(usec))
+
+
+def stream_is_behind(last_event: datetime, until: datetime) -> bool:
+    """Whether docker has recorded events after `last_event` and up to `until`, asking it over a separate connection."""
+    last_second = int(last_event.timestamp())
+    return any(event["time"] > last_second for event in dockerapi.get_events(since=last_event, until=until))
+
+
+class NullNotifier:
+    """Stand-in for `sdnotify.SystemdNotifier` that discards notifications, for use outside of a systemd service."""
+
+    def notify(self, state: str):
+        pass
+
+
+class ServiceMonitor:
+    """Tracks progress of the watcher and reports it to systemd as STATUS= lines and WATCHDOG=1 heartbeats."""
+
+    def __init__(self, notifier: sdnotify.SystemdNotifier | NullNotifier):
+        self.notifier = notifier
+        self.events = 0
+        self.last_event: datetime | None = None
+        # The first check always passes, giving the stream one interval to replay events buffered before a restart
+        self._events_at_check = -1
+        self.rate = 0.0
+        self._rate_events = 0
+        self._rate_since = time.monotonic()
+        self.sweep_done: int | None = None
+        self.sweep_total = 0
+        self.last_sweep: str | None = None
+
+    def event_processed(self, time: datetime):
+        self.events += 1
+        self.last_event = time
+
+    def sweep_started(self, total: int):
+        self.sweep_done = 0
+        self.sweep_total = total
+        self.notify_status()
+
+    def sweep_progress(self):
+        self.sweep_done += 1
+        self.notify_status()
+
+    def sweep_finished(self, deleted: int):
+        self.last_sweep = f"last sweep {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} deleted {deleted} images"
+        self.sweep_done = None
+        self.notify_status()
+
+    def update_rate(self):
+        """Recompute event throughput over the time since the previous call."""
+        now = time.monotonic()
+        if now > self._rate_since:
+            self.rate = (self.events - self._rate_events) / (now - self._rate_since) * 60
+
+        self._rate_events = self.events
+        self._rate_since = now
+
+    def status(self) -> str:
+        parts = [f"{self.events} events processed ({self.rate:.1f}/min)"]
+
+        if self.sweep_done is not None:
+            parts.append(f"sweeping {self.sweep_done}/{self.sweep_total} images")
+        elif self.last_sweep is not None:
+            parts.append(self.last_sweep)
+
+        return "; ".join(parts)
+
+    def notify_status(self):
+        self.notifier.notify(f"STATUS={self.status()}")
+
+    async def stream_healthy(self) -> bool:
+        """Whether the event stream has delivered everything docker recorded, up to `STREAM_GRACE` ago.
+
+        A stalled stream still looks alive from the outside: its reading thread stays blocked and its task never ends.
+        So unless events were processed since the previous check, docker is asked directly whether it has newer events.
+        """
+        progressed = self.events != self._events_at_check
+        self._events_at_check = self.events
+        if progressed or self.last_event is None:
+            return True
+
+        until = datetime.now().astimezone() - STREAM_GRACE
+        if self.last_event >= until:
+            return True
+
+        try:
+            return not await asyncio.to_thread(stream_is_behind, self.last_event, until)
+        except requests.RequestException as e:
+            logger.warning("cannot check docker event stream: %s", e)
+            return False
+
+    async def run(self, events_task: asyncio.Task):
+        """Report status periodically, and send watchdog heartbeats while the watcher is healthy.
+
+        A heartbeat is only sent when this coroutine gets scheduled at all (the event loop is not blocked), the task
+        handling docker events is still running, and the event stream keeps up with docker (see `stream_healthy`).
+        Otherwise systemd will restart the service once `WatchdogSec` runs out.
+
+        Returns right away when there is no systemd to report to, even if the watchdog environment variables are set,
+        which happens when running embedded in another service.
+        """
+        if isinstance(self.notifier, NullNotifier):
+            return
+
+        watchdog = watchdog_interval()
+        interval = STATUS_INTERVAL if watchdog is None else min(watchdog / 2, STATUS_INTERVAL)
+
+        while True:
+            if watchdog is not None:
+                if events_task.done():
+                    logger.error("docker event stream has stopped, withholding watchdog heartbeat")
+                    return
+
+                if await self.stream_healthy():
+                    self.notifier.notify("WATCHDOG=1")
+                else:
+                    logger.warning("docker event stream has stalled, withholding watchdog heartbeat")
+
+            self.update_rate()
+            self.notify_status()
+            await asyncio.sleep(interval.total_seconds())
@@ -1,7 +1,7 @@
 import json
 import logging
+import socket
 from datetime import datetime
-from typing import Iterable
 
 from requests.compat import quote
 
@@ -16,13 +16,56 @@ SOCKET_PATH = "/var/run/docker.sock"
 SOCKET_URL = f"http+unix://{quote(SOCKET_PATH, safe='')}"
 
 
+class EventStream:
+    """Iterable of json events from Docker socket as dicts.
+
+    Unlike a generator, the stream can be closed from another thread, which wakes up a thread blocked reading it.
+    """
+
+    def __init__(self, arguments: dict):
+        self.arguments = arguments
+        self.response = None
+        self.closed = False
+
+    def __iter__(self):
+        self.response = _session.get(f"{SOCKET_URL}/events", params=self.arguments, stream=True)
+        if self.closed:
+            self.close()
+            return
+
+        self.response.raise_for_status()
+
+        for line in self.response.iter_lines():
+            if line == "":
+                # keep-alive line
+                continue
+
+            decoded_line = line.decode("utf-8")
+            yield json.loads(decoded_line)
+
+    def close(self):
+        self.closed = True
+        if self.response is None:
+            return
+
+        # Closing the response waits for the stream to end, which can take forever. Shutting down the socket does not.
+        connection = getattr(self.response.raw, "_connection", None)
+        if connection is not None and connection.sock is not None:
+            try:
+                connection.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass  # Already closed
+
+        self.response.close()
+
+
 def get_events(
     *,
     since: datetime | None = None,
     until: datetime | None = None,
     filters: dict | None = None,
-) -> Iterable[dict]:
-    """Generator that yields json events from Docker socket as dicts."""
+) -> EventStream:
+    """Return a stream of json events from Docker socket. The request is made once iteration starts."""
     arguments = {}
     if since is not None:
         arguments["since"] = int(since.timestamp())
@@ -33,20 +76,45 @@ def get_events(
     if filters is not None:
         arguments["filters"] = quote(json.dumps(filters))
 
-    response = _session.get(f"{SOCKET_URL}/events", params=arguments, stream=True)
+    return EventStream(arguments)
+
+
+def get_container(id: str):
+    response = _session.get(f"{SOCKET_URL}/containers/{id}/json")
+    if response.status_code == 404:
+        return None
+
     response.raise_for_status()
+    return response.json()
 
-    for line in response.iter_lines():
-        if line == "":
-            # keep-alive line
-            continue
 
-        decoded_line = line.decode("utf-8")
-        yield json.loads(decoded_line)
+def get_containers(*, all: bool = False, filters: dict | None = None) -> list:
+    arguments = {"all": int(all)}
+    if filters is not None:
+        arguments["filters"] = json.dumps(filters)
 
+    response = _session.get(f"{SOCKET_URL}/containers/json", params=arguments)
+    response.raise_for_status()
+    return response.json()
 
-def get_container(id: str):
-    response = _session.get(f"{SOCKET_URL}/containers/{id}/json")
+
+def prune_containers(*, filters: dict | None = None):
+    arguments = {}
+    if filters is not None:
+        arguments["filters"] = json.dumps(filters)
+
+    response = _session.post(f"{SOCKET_URL}/containers/prune", params=arguments)
+    response.raise_for_status()
+    return response.json()
+
+
+def delete_container(id: str):
+    response = _session.delete(f"{SOCKET_URL}/containers/{id}")
+    response.raise_for_status()
+
+
+def get_image(id: str):
+    response = _session.get(f"{SOCKET_URL}/images/{id}/json")
     if response.status_code == 404:
         return None
 
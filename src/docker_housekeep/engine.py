@@ -0,0 +1,256 @@
+"""In-process docker-housekeep engine, for embedding DH into another asyncio application.
+
+    engine = Engine(config_mod.load_path("/etc/docker-housekeep.conf"), storage=FileStateStorage.open("state.json"))
+    await engine.start()
+    ...
+    images = await engine.query()
+    deleted = await engine.sweep()
+    ...
+    await engine.shutdown()
+
+The `watch` command is a thin wrapper around this.
+"""
+
+import asyncio
+import copy
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import AsyncIterable, Callable, Iterable
+
+from croniter import croniter
+
+from . import dockerapi
+from . import policy as policy_mod
+from .base import apply_event, delete_image, finish_sweep, resolve_event, select_images, unblock_images, update_state
+from .config import Config, default_config
+from .daemon import NullNotifier, ServiceMonitor
+from .state import ImageHistory, MemoryStateStorage, State, StateStorage
+
+logger = logging.getLogger("docker_housekeep")
+
+# Called with the time of the last processed event, returns docker events from that time onwards
+EventSource = Callable[[datetime], Iterable[dict] | AsyncIterable[dict]]
+
+
+async def iterate_in_thread(sync_iterable):
+    """Convert a blocking iterable into an async one, by iterating it in a dedicated daemon thread.
+
+    When the async iteration is stopped, the iterable is closed if it has a `close()` method, which should wake up the
+    thread. Even if it does not, a daemon thread, unlike the default executor, does not keep the event loop or the
+    process from exiting.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stopped = threading.Event()
+    done_sentinel = object()
+
+    def put(item):
+        if not stopped.is_set():
+            queue.put_nowait(item)
+
+    def read():
+        try:
+            try:
+                for value in sync_iterable:
+                    if stopped.is_set():
+                        return
+                    loop.call_soon_threadsafe(put, (value, None))
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                loop.call_soon_threadsafe(put, (done_sentinel, e))
+            else:
+                loop.call_soon_threadsafe(put, (done_sentinel, None))
+        except RuntimeError:
+            pass  # The event loop was closed in the meantime
+
+    threading.Thread(target=read, name="docker-housekeep-events", daemon=True).start()
+
+    try:
+        while True:
+            value, error = await queue.get()
+            if value is done_sentinel:
+                if error is not None:
+                    raise error
+                return
+            yield value
+    finally:
+        stopped.set()
+        close = getattr(sync_iterable, "close", None)
+        if close is not None:
+            try:
+                close()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.debug("failed to close event source: %s", e)
+
+
+def docker_events(since: datetime) -> Iterable[dict]:
+    return dockerapi.get_events(since=since)
+
+
+@dataclass
+class ImageStatus:
+    id: str
+    last_used: datetime
+    history: ImageHistory | None
+    retention: timedelta
+
+    @property
+    def expires(self) -> datetime:
+        """Time after which a sweep will delete this image, if it is not used again."""
+        return self.last_used + self.retention
+
+
+class Engine:
+    """Watches docker events, keeps image usage state up to date, and sweeps images according to `config`.
+
+    Args:
+        config: Configuration to use. Defaults to the default configuration.
+        storage: Where state is loaded from and saved to after every event. Defaults to keeping it in memory.
+        events: Source of docker events. Defaults to the docker socket.
+        notifier: Receives systemd notifications (READY=1, STATUS=, WATCHDOG=1). Defaults to discarding them.
+        schedule_sweeps: Whether to sweep according to `config.sweep_schedule` while running.
+        record_fd: If given, received events are appended to it for later replay with the `simulate` command.
+    """
+
+    def __init__(
+        self,
+        config: Config | None = None,
+        *,
+        storage: StateStorage | None = None,
+        events: EventSource = docker_events,
+        notifier=None,
+        schedule_sweeps: bool = True,
+        record_fd=None,
+    ):
+        self.config = config or default_config
+        self.storage = storage or MemoryStateStorage()
+        self.events = events
+        self.notifier = notifier or NullNotifier()
+        self.schedule_sweeps = schedule_sweeps
+        self.record_fd = record_fd
+
+        self.monitor = ServiceMonitor(self.notifier)
+        self.state: State | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._sweep_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.shutdown()
+
+    def _ensure_state(self) -> State:
+        if self.state is None:
+            self.state = self.storage.load()
+        return self.state
+
+    async def start(self):
+        """Load state and start watching events in the running event loop. Returns immediately."""
+        if self._tasks:
+            raise RuntimeError("engine is already running")
+
+        state = self._ensure_state()
+        self.monitor.last_event = state.timestamp or datetime.now().astimezone()
+
+        events_task = asyncio.create_task(self._handle_events(state.timestamp or datetime.fromtimestamp(0)))
+        self._tasks.append(events_task)
+
+        if self.schedule_sweeps:
+            self._tasks.append(asyncio.create_task(self._periodic_sweep()))
+
+        self.notifier.notify("READY=1")
+        self._tasks.append(asyncio.create_task(self.monitor.run(events_task)))
+
+    async def wait(self):
+        """Wait until the engine stops, re-raising the error that stopped it, if any. Shuts the engine down after."""
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            await self.shutdown()
+
+    async def run(self):
+        """Start the engine and run it until it stops."""
+        await self.start()
+        await self.wait()
+
+    async def shutdown(self):
+        """Stop watching events and sweeping, and save state."""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        if self.state is not None:
+            self.storage.save(self.state)
+
+    async def sweep(self) -> list:
+        """Delete images according to the eviction policy right away. Returns IDs of deleted images."""
+        async with self._sweep_lock:
+            state = self._ensure_state()
+
+            # Images are deleted in a worker thread, so that events keep being processed and the watchdog stays fed
+            now = datetime.now().astimezone()
+            images = await asyncio.to_thread(unblock_images, select_images(state, self.config, now), self.config, now)
+            self.monitor.sweep_started(len(images))
+
+            deleted = []
+            for image in images:
+                if await asyncio.to_thread(delete_image, image):
+                    # Do not wait for the "delete" event, which never comes if the engine is not watching events
+                    update_state(state, image, None)
+                    deleted.append(image)
+                self.monitor.sweep_progress()
+
+            finish_sweep(state, self.config, now)
+            self.storage.save(state)
+            self.monitor.sweep_finished(len(deleted))
+            return deleted
+
+    async def query(self, image: str | None = None) -> list:
+        """Return the status of tracked images, or only of `image` if given, as a list of `ImageStatus`."""
+        state = self._ensure_state()
+        policy = policy_mod.from_config(self.config)
+        now = datetime.now().astimezone()
+
+        ids = list(state.last_used) if image is None else [image] if image in state.last_used else []
+        return [
+            ImageStatus(
+                id=id,
+                last_used=state.last_used[id],
+                history=copy.deepcopy(state.history.get(id)),
+                retention=policy.retention(id, state, now),
+            )
+            for id in ids
+        ]
+
+    async def _handle_events(self, since: datetime):
+        events = self.events(since)
+        if not hasattr(events, "__aiter__"):
+            events = iterate_in_thread(events)
+
+        logger.info("watching docker events")
+
+        async for event in events:
+            # Resolving the event may query docker, so keep it off the event loop. State is only modified on the loop.
+            image, size = await asyncio.to_thread(resolve_event, event, self.state)
+            apply_event(event, self.state, image, size)
+
+            if self.record_fd is not None:
+                size = self.state.history[image].size if image in self.state.history else None
+                self.record_fd.write(json.dumps({"event": event, "image": image, "size": size}) + "\n")
+                self.record_fd.flush()
+
+            self.storage.save(self.state)
+            self.monitor.event_processed(self.state.timestamp)
+
+    async def _periodic_sweep(self):
+        while True:
+            now = datetime.now()
+            sweep_time = croniter(self.config.sweep_schedule, start_time=now).get_next(ret_type=datetime)
+            logger.info("scheduled next sweep for %s", sweep_time.strftime("%Y-%m-%d %H:%M:%S"))
+            await asyncio.sleep((sweep_time - now).total_seconds())
+            await self.sweep()
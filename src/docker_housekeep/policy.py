@@ -0,0 +1,82 @@
+"""Eviction policies, deciding which images a sweep should delete.
+
+The "age" policy is the original behavior: any image unused for longer than `max-age` is deleted.
+
+The "cost" policy weighs what deleting an image would cost if it gets used again. Every image keeps a short history of
+its uses and pulls, from which a frequency decayed with `frequency-half-life` is computed (LFU with aging). That gives
+the expected number of uses within the next `max-age`, and from it the expected re-pull bytes, which are scaled up
+further for images that have recently been pulled again and again. An image is then retained for
+
+    max-age * (1 + expected re-pull bytes / reference-size)
+
+so large images that are regularly reused survive gaps longer than `max-age`, while small or rarely used images are
+deleted on the same schedule as with the "age" policy. As the decayed frequency of an unused image keeps falling, its
+retention shrinks back towards `max-age`.
+"""
+
+import math
+from datetime import datetime, timedelta
+
+from .config import Config
+from .state import ImageHistory, State
+
+
+def decayed_count(times: list, now: datetime, half_life: timedelta) -> float:
+    """Count events, with each one weighed down by half for every `half_life` that has passed since it happened."""
+    return sum(0.5 ** ((now - time) / half_life) for time in times if time <= now)
+
+
+class AgePolicy:
+    def __init__(self, config: Config):
+        self.max_age = config.max_age
+
+    def retention(self, id: str, state: State, now: datetime) -> timedelta:
+        return self.max_age
+
+    def select(self, state: State, now: datetime) -> list:
+        """Return IDs of images that should be deleted at time `now`, cheapest to lose first."""
+        return sorted(
+            (id for id, last_used in state.last_used.items() if now - last_used > self.retention(id, state, now)),
+            key=lambda id: state.last_used[id],
+        )
+
+
+class CostPolicy(AgePolicy):
+    def __init__(self, config: Config):
+        super().__init__(config)
+        self.half_life = config.frequency_half_life
+        self.reference_size = config.reference_size
+
+    def repull_cost(self, history: ImageHistory, now: datetime) -> float:
+        """Expected bytes that would be pulled again within `max-age` if the image was deleted at time `now`."""
+        if not history.size:
+            return 0.0
+
+        # With exponential decay, a decayed count converges to (use rate * mean lifetime of a use)
+        mean_lifetime = self.half_life / math.log(2)
+        expected_uses = decayed_count(history.uses, now, self.half_life) * (self.max_age / mean_lifetime)
+        thrashing = 1 + decayed_count(history.pulls, now, self.half_life)
+
+        return history.size * expected_uses * thrashing
+
+    def retention(self, id: str, state: State, now: datetime) -> timedelta:
+        history = state.history.get(id)
+        if history is None:
+            return self.max_age
+
+        return self.max_age * (1 + self.repull_cost(history, now) / self.reference_size)
+
+    def select(self, state: State, now: datetime) -> list:
+        def cost(id):
+            history = state.history.get(id)
+            return 0.0 if history is None else self.repull_cost(history, now)
+
+        return sorted(super().select(state, now), key=cost)
+
+
+POLICIES = {"age": AgePolicy, "cost": CostPolicy}
+
+
+def from_config(config: Config, name: str | None = None) -> AgePolicy:
+    """Construct the eviction policy named `name`, or the one selected in `config` if omitted."""
+    return POLICIES[name or config.eviction_policy](config)
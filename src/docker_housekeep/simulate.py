@@ -0,0 +1,91 @@
+"""Replay a recorded event log to compare eviction policies.
+
+Event logs are recorded by `watch --record-events` as JSON lines, one per docker event:
+
+    {"event": <docker event>, "image": <image ID the event concerns, or null>, "size": <image size, or null>}
+
+Each policy starts from an empty state and sweeps according to `sweep-schedule`. Whenever a recorded event uses an
+image that the policy has already evicted, the image counts as re-pulled. Only pulls, tags and container creation
+count as uses. Untagging and deletion found in the log are ignored, because they were decided by whatever policy was
+running when the log was recorded.
+"""
+
+import json
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+
+from croniter import croniter
+
+from . import policy as policy_mod
+from .base import apply_event, fromtimestamp, is_use
+from .config import Config
+from .state import State
+
+logger = logging.getLogger("docker_housekeep")
+
+
+@dataclass
+class SimulationResult:
+    policy: str
+    evictions: int = 0
+    repulls: int = 0
+    repull_bytes: int = 0
+
+
+def load_records(fd) -> list:
+    return [json.loads(line) for line in fd if line.strip() != ""]
+
+
+def simulate(records: list, config: Config, policy_name: str) -> SimulationResult:
+    # Replaying logs every state update, which is only noise here
+    level = logger.level
+    logger.setLevel(logging.WARNING)
+    try:
+        return _simulate(records, config, policy_name)
+    finally:
+        logger.setLevel(level)
+
+
+def _simulate(records: list, config: Config, policy_name: str) -> SimulationResult:
+    policy = policy_mod.from_config(config, policy_name)
+    result = SimulationResult(policy=policy_name)
+    state = State()
+    evicted = set()
+    next_sweep = None
+
+    for record in records:
+        event = record["event"]
+        image = record["image"]
+        time = fromtimestamp(event["time"])
+
+        if next_sweep is None:
+            next_sweep = croniter(config.sweep_schedule, start_time=time).get_next(ret_type=datetime)
+
+        while next_sweep <= time:
+            for id in policy.select(state, next_sweep):
+                del state.last_used[id]
+                evicted.add(id)
+                result.evictions += 1
+
+            next_sweep = croniter(config.sweep_schedule, start_time=next_sweep).get_next(ret_type=datetime)
+
+        if image is None or not is_use(event):
+            continue
+
+        apply_event(event, state, image, record["size"])
+
+        if image in evicted:
+            evicted.remove(image)
+            result.repulls += 1
+            result.repull_bytes += state.history_of(image).size or 0
+
+    return result
+
+
+def report(results: list):
+    lines = [f"{'policy':<10} {'evictions':>10} {'re-pulls':>10} {'re-pulled bytes':>20}"]
+    for result in results:
+        lines.append(f"{result.policy:<10} {result.evictions:>10} {result.repulls:>10} {result.repull_bytes:>20,}")
+
+    logger.info("\n".join(lines))
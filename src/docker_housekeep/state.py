@@ -1,14 +1,60 @@
 import dataclasses
+import fcntl
 import json
+import logging
 import os
+from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from datetime import datetime
 
+logger = logging.getLogger("docker_housekeep")
+
+# How many of the most recent uses and pulls are remembered per image. Older ones contribute almost nothing to a
+# decayed frequency anyway, and this keeps the state file bounded on hosts that start containers all day long.
+MAX_HISTORY = 16
+
+
+@dataclass
+class ImageHistory:
+    uses: list = dataclasses.field(default_factory=list)
+    pulls: list = dataclasses.field(default_factory=list)
+    size: int | None = None
+
+    # Watching resumes from the second of the last processed event, so events from that second are seen again after a
+    # restart. Those are recognized by having the exact same time as an entry already in the history.
+
+    def add_use(self, time: datetime):
+        if time not in self.uses:
+            self.uses = self.uses[-(MAX_HISTORY - 1) :] + [time]
+
+    def add_pull(self, time: datetime):
+        if time not in self.pulls:
+            self.pulls = self.pulls[-(MAX_HISTORY - 1) :] + [time]
+
+    def newest(self) -> datetime | None:
+        return max(self.uses + self.pulls, default=None)
+
 
 @dataclass
 class State:
     timestamp: datetime | None = None
     last_used: dict = dataclasses.field(default_factory=dict)
+    history: dict = dataclasses.field(default_factory=dict)
+
+    def history_of(self, id: str) -> ImageHistory:
+        """Get the usage history of an image, creating an empty one if necessary."""
+        return self.history.setdefault(id, ImageHistory())
+
+
+def forget(state: State, before: datetime):
+    """Drop history of deleted images that have not been seen since `before`."""
+    for id in list(state.history):
+        if id in state.last_used:
+            continue
+
+        newest = state.history[id].newest()
+        if newest is None or newest < before:
+            del state.history[id]
 
 
 def load(fd):
@@ -26,6 +72,14 @@ def load(fd):
     for id in result.last_used:
         result.last_used[id] = datetime.fromisoformat(result.last_used[id])
 
+    # State files written before usage history was tracked do not have this field
+    for id, history_data in state_data.get("history", {}).items():
+        result.history[id] = ImageHistory(
+            uses=[datetime.fromisoformat(time) for time in history_data["uses"]],
+            pulls=[datetime.fromisoformat(time) for time in history_data["pulls"]],
+            size=history_data["size"],
+        )
+
     return result
 
 
@@ -36,3 +90,70 @@ def dump(state: State, fd):
         return json.JSONEncoder().default(obj)
 
     json.dump(dataclasses.asdict(state), fd, default=default, indent="\t")
+
+
+class StateStorage(ABC):
+    """Where an engine loads its state from and saves it to. Subclass this to keep state elsewhere."""
+
+    @abstractmethod
+    def load(self) -> State: ...
+
+    @abstractmethod
+    def save(self, state: State): ...
+
+
+class MemoryStateStorage(StateStorage):
+    """Keeps state in memory only, for when persisting it is handled by someone else or not needed."""
+
+    def __init__(self, state: State | None = None):
+        self.state = state or State()
+
+    def load(self) -> State:
+        return self.state
+
+    def save(self, state: State):
+        self.state = state
+
+
+class FileStateStorage(StateStorage):
+    """Keeps state in a JSON file, given as a file object opened for reading and writing.
+
+    The first storage to open a file takes a lock on it, and only that one saves state into it. This way, a one-off
+    sweep does not overwrite the state file of a running watcher, which records the sweep's deletions by itself.
+    """
+
+    def __init__(self, fd):
+        self.fd = fd
+
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self.owned = True
+        except BlockingIOError:
+            self.owned = False
+
+    @classmethod
+    def open(cls, path, *, create=True):
+        """Open a state file at `path`, creating it if it does not exist and `create` is true."""
+        if not create:
+            return cls(open(path, "r+", encoding="utf-8"))
+
+        try:
+            return cls(open(path, "x+", encoding="utf-8"))
+        except FileExistsError:
+            return cls(open(path, "r+", encoding="utf-8"))
+
+    def load(self) -> State:
+        self.fd.seek(0)
+        return load(self.fd)
+
+    def save(self, state: State):
+        if not self.owned:
+            logger.info("not saving state: %s is in use by another process", self.fd.name)
+            return
+
+        self.fd.seek(0)
+        dump(state, self.fd)
+        self.fd.truncate()
+
+    def close(self):
+        self.fd.close()
@@ -0,0 +1,13 @@
+import pytest
+
+from docker_housekeep.config import Config
+
+
+@pytest.fixture
+def make_config():
+    """Factory of configs with a daily sweep and a `max-age` of one week, with other fields given as arguments."""
+
+    def factory(**kwargs):
+        return Config(sweep_schedule="0 6 * * *", max_age="1w", **kwargs)
+
+    return factory
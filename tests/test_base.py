@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from docker_housekeep import base, dockerapi
+
+NOW = datetime.now().astimezone()
+OLD = int((NOW - timedelta(days=30)).timestamp())
+NEW = int((NOW - timedelta(hours=1)).timestamp())
+
+
+@pytest.fixture
+def docker(monkeypatch):
+    """Fake docker with a list of containers, recording which were pruned or removed."""
+
+    class Docker:
+        containers = {}
+        pruned = None
+        removed = []
+
+        def add(self, id, state, created, finished="0001-01-01T00:00:00Z"):
+            self.containers[id] = {"Id": id, "State": state, "Created": created, "FinishedAt": finished}
+
+        def prune(self, filters):
+            self.pruned = filters
+            return {"ContainersDeleted": ["x"], "SpaceReclaimed": 0}
+
+    docker = Docker()
+    monkeypatch.setattr(dockerapi, "get_containers", lambda all=False, filters=None: list(docker.containers.values()))
+    monkeypatch.setattr(
+        dockerapi, "get_container", lambda id: {"State": {"FinishedAt": docker.containers[id]["FinishedAt"]}}
+    )
+    monkeypatch.setattr(dockerapi, "prune_containers", docker.prune)
+    monkeypatch.setattr(dockerapi, "delete_container", docker.removed.append)
+    return docker
+
+
+def test_prunes_when_all_old_containers_are_stale(docker, make_config):
+    docker.add("stale", "exited", OLD, "2020-01-01T00:00:00Z")
+    docker.add("young", "exited", NEW, NOW.isoformat())
+
+    assert base.remove_stale_containers(make_config(container_cleanup=True, container_labels=["ci"]), NOW) == 1
+    assert docker.pruned["label"] == ["ci"]
+    assert docker.removed == []
+
+
+def test_removes_one_by_one_when_prune_would_remove_recently_exited(docker, make_config):
+    docker.add("stale", "exited", OLD, "2020-01-01T00:00:00Z")
+    docker.add("recent", "exited", OLD, NOW.isoformat())
+
+    assert base.remove_stale_containers(make_config(container_cleanup=True, container_labels=["ci"]), NOW) == 1
+    assert docker.pruned is None
+    assert docker.removed == ["stale"]
+
+
+def test_keeps_containers_that_never_started(docker, make_config):
+    docker.add("stale", "exited", OLD, "2020-01-01T00:00:00Z")
+    docker.add("holder", "created", OLD)
+
+    assert base.remove_stale_containers(make_config(container_cleanup=True, container_labels=["ci"]), NOW) == 1
+    assert docker.pruned is None
+    assert docker.removed == ["stale"]
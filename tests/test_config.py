@@ -0,0 +1,46 @@
+import io
+
+import pytest
+
+from docker_housekeep import config as config_mod
+from docker_housekeep.config import format_size, parse_size
+
+
+@pytest.mark.parametrize(
+    ("string", "size"),
+    [
+        ("123", 123),
+        ("1B", 1),
+        ("1GB", 10**9),
+        ("1.5 GB", 15 * 10**8),
+        ("512MiB", 512 * 1024**2),
+        ("2kb", 2000),
+    ],
+)
+def test_parse_size(string, size):
+    assert parse_size(string) == size
+
+
+@pytest.mark.parametrize("string", ["", "GB", "1 XB", "-1GB", "1e9"])
+def test_parse_size_invalid(string):
+    assert parse_size(string) is None
+
+
+@pytest.mark.parametrize(("size", "string"), [(10**9, "1GB"), (1500 * 10**6, "1500MB"), (0, "0B"), (1023, "1023B")])
+def test_format_size(size, string):
+    assert format_size(size) == string
+    assert parse_size(string) == size
+
+
+def test_load_overrides_defaults():
+    config = config_mod.load(io.StringIO("max-age: 3d\neviction-policy: cost\nreference-size: 512MiB\n"))
+
+    assert config.max_age.days == 3
+    assert config.eviction_policy == "cost"
+    assert config.reference_size == 512 * 1024**2
+    assert config.sweep_schedule == config_mod.default_config.sweep_schedule
+
+
+def test_load_rejects_invalid_size():
+    with pytest.raises(ValueError, match="reference-size"):
+        config_mod.load(io.StringIO("reference-size: lots\n"))
@@ -0,0 +1,151 @@
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+import requests
+
+from docker_housekeep import daemon
+from docker_housekeep.__main__ import cli, memory_max_argument, weight_argument
+from docker_housekeep.daemon import NullNotifier, ServiceMonitor, render_service
+
+
+def check(monitor):
+    return asyncio.run(monitor.stream_healthy())
+
+
+def test_stream_healthy_while_processing_events(monkeypatch):
+    monkeypatch.setattr(daemon, "stream_is_behind", lambda last_event, until: True)
+    monitor = ServiceMonitor(NullNotifier())
+    monitor.event_processed(datetime.now().astimezone() - timedelta(hours=1))
+
+    assert check(monitor)
+
+
+def test_stream_stalled_when_docker_has_newer_events(monkeypatch):
+    monkeypatch.setattr(daemon, "stream_is_behind", lambda last_event, until: True)
+    monitor = ServiceMonitor(NullNotifier())
+    monitor.event_processed(datetime.now().astimezone() - timedelta(hours=1))
+    check(monitor)
+
+    assert not check(monitor)
+
+
+def test_stream_healthy_when_docker_is_idle(monkeypatch):
+    monkeypatch.setattr(daemon, "stream_is_behind", lambda last_event, until: False)
+    monitor = ServiceMonitor(NullNotifier())
+    monitor.last_event = datetime.now().astimezone() - timedelta(hours=1)
+
+    assert check(monitor)
+
+
+def test_stream_stalled_when_docker_fails(monkeypatch):
+    def stream_is_behind(last_event, until):
+        raise requests.ConnectionError("docker is gone")
+
+    monkeypatch.setattr(daemon, "stream_is_behind", stream_is_behind)
+    monitor = ServiceMonitor(NullNotifier())
+    monitor.last_event = datetime.now().astimezone() - timedelta(hours=1)
+    check(monitor)
+
+    assert not check(monitor)
+
+
+def test_no_watchdog_without_notifier(monkeypatch):
+    monkeypatch.setenv("WATCHDOG_USEC", "1000000")
+    monkeypatch.delenv("WATCHDOG_PID", raising=False)
+    monkeypatch.setattr(daemon, "stream_is_behind", lambda last_event, until: pytest.fail("docker was queried"))
+
+    async def run():
+        events_task = asyncio.create_task(asyncio.sleep(10))
+        await asyncio.wait_for(ServiceMonitor(NullNotifier()).run(events_task), timeout=1)
+        events_task.cancel()
+
+    asyncio.run(run())
+
+
+def test_stream_not_stalled_at_startup(monkeypatch):
+    monkeypatch.setattr(daemon, "stream_is_behind", lambda last_event, until: True)
+    monitor = ServiceMonitor(NullNotifier())
+    monitor.last_event = datetime.now().astimezone() - timedelta(hours=1)
+
+    assert check(monitor)
+    assert not check(monitor)
+
+
+def directives(unit: str) -> dict:
+    return dict(line.split("=", 1) for line in unit.splitlines() if "=" in line and not line.startswith("#"))
+
+
+def test_render_service():
+    unit = render_service(
+        Path("/opt/dh/bin/docker-housekeep"),
+        watchdog_sec=timedelta(minutes=3),
+        memory_max="256M",
+        cpu_weight=20,
+        io_weight=10,
+        io_scheduling_class="idle",
+    )
+
+    assert directives(unit) == {
+        "Description": "Docker image housekeeping daemon",
+        "After": "docker.service",
+        "Type": "notify",
+        "ExecStart": "/opt/dh/bin/docker-housekeep watch --state-file /var/lib/docker-housekeep/state.json",
+        "Restart": "on-failure",
+        "WatchdogSec": "180",
+        "MemoryMax": "256M",
+        "CPUWeight": "20",
+        "IOWeight": "10",
+        "IOSchedulingClass": "idle",
+        "WantedBy": "multi-user.target",
+    }
+
+
+def test_render_service_rounds_watchdog_up():
+    unit = render_service(
+        Path("docker-housekeep"),
+        watchdog_sec=timedelta(seconds=0.5),
+        memory_max="infinity",
+        cpu_weight=1,
+        io_weight=1,
+        io_scheduling_class="best-effort",
+    )
+
+    assert directives(unit)["WatchdogSec"] == "1"
+
+
+def test_install_defaults():
+    args = cli().parse_args(["daemon", "install"])
+
+    assert args.watchdog_sec == timedelta(minutes=3)
+    assert (args.memory_max, args.cpu_weight, args.io_weight, args.io_scheduling_class) == ("256M", 20, 10, "idle")
+
+
+@pytest.mark.parametrize(("string", "weight"), [("1", 1), ("100", 100), ("10000", 10000)])
+def test_weight_argument(string, weight):
+    assert weight_argument(string) == weight
+
+
+@pytest.mark.parametrize("string", ["0", "10001", "-5", "", "ten"])
+def test_weight_argument_invalid(string):
+    with pytest.raises(argparse.ArgumentTypeError):
+        weight_argument(string)
+
+
+@pytest.mark.parametrize("string", ["256M", "1G", "1073741824", "10%", "12.5%", "infinity"])
+def test_memory_max_argument(string):
+    assert memory_max_argument(string) == string
+
+
+@pytest.mark.parametrize("string", ["", "256MB", "-1G", "lots", "256M\nExecStartPre=/bin/true"])
+def test_memory_max_argument_invalid(string):
+    with pytest.raises(argparse.ArgumentTypeError):
+        memory_max_argument(string)
+
+
+@pytest.mark.parametrize("string", ["0s", "0"])
+def test_watchdog_sec_must_be_positive(string):
+    with pytest.raises(SystemExit):
+        cli().parse_args(["daemon", "install", "--watchdog-sec", string])
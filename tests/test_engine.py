@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from docker_housekeep import Engine, MemoryStateStorage, State, StateStorage, dockerapi
+
+NOW = datetime.now().astimezone()
+
+
+def test_sweep_without_start_updates_and_saves_state(monkeypatch, make_config):
+    deleted = []
+    monkeypatch.setattr(dockerapi, "get_containers", lambda all=False, filters=None: [])
+    monkeypatch.setattr(dockerapi, "delete_image", lambda id: deleted.append(id) or [{"Deleted": id}])
+
+    storage = MemoryStateStorage(State(last_used={"old": NOW - timedelta(days=30), "new": NOW}))
+    saved = []
+    monkeypatch.setattr(storage, "save", saved.append)
+    engine = Engine(make_config(), storage=storage, schedule_sweeps=False)
+
+    async def run():
+        assert await engine.sweep() == ["old"]
+        assert [status.id for status in await engine.query()] == ["new"]
+        assert await engine.sweep() == []
+
+    asyncio.run(run())
+    assert deleted == ["old"]
+    assert list(saved[0].last_used) == ["new"]
+
+
+def test_events_update_state(monkeypatch):
+    monkeypatch.setattr(dockerapi, "get_image", lambda id: {"Size": 1})
+
+    async def events(since):
+        yield {"Type": "image", "Action": "untag", "id": "image", "time": int(NOW.timestamp())}
+
+    engine = Engine(events=events, schedule_sweeps=False)
+
+    async def run():
+        async with engine:
+            await asyncio.sleep(0.1)
+            return await engine.query("image")
+
+    [status] = asyncio.run(run())
+    assert status.last_used == datetime.fromtimestamp(int(NOW.timestamp())).astimezone()
+    assert status.history is None
+
+
+def test_incomplete_storage_fails_early():
+    class Storage(StateStorage):
+        def load(self):
+            return State()
+
+    with pytest.raises(TypeError):
+        Storage()
+
+
+class BlockingSource:
+    """Event source that blocks like an idle docker event stream, until it is closed."""
+
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        self.closed.wait(timeout=30)
+        return iter(())
+
+    def close(self):
+        self.closed.set()
+
+
+def run_and_shut_down(source):
+    async def run():
+        engine = Engine(events=lambda since: source, schedule_sweeps=False)
+        await engine.start()
+        await asyncio.sleep(0.1)
+        await engine.shutdown()
+
+    started = time.monotonic()
+    asyncio.run(run())
+    return time.monotonic() - started
+
+
+def test_shutdown_closes_blocking_event_source():
+    source = BlockingSource()
+
+    assert run_and_shut_down(source) < 5
+    assert source.closed.is_set()
+
+
+def test_shutdown_does_not_wait_for_unclosable_event_source():
+    never = threading.Event()
+
+    def source():
+        never.wait(timeout=30)
+        yield from ()
+
+    assert run_and_shut_down(source()) < 5
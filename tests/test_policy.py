@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from docker_housekeep.policy import AgePolicy, CostPolicy, decayed_count
+from docker_housekeep.state import ImageHistory, State
+
+NOW = datetime(2024, 6, 1, tzinfo=timezone.utc)
+DAY = timedelta(days=1)
+
+
+def make_state(**images):
+    """Build a state from images given as (days since last use, size, days of uses, days of pulls)."""
+    state = State()
+    for id, (last_used, size, uses, pulls) in images.items():
+        state.last_used[id] = NOW - last_used * DAY
+        state.history[id] = ImageHistory(
+            uses=[NOW - day * DAY for day in uses],
+            pulls=[NOW - day * DAY for day in pulls],
+            size=size,
+        )
+    return state
+
+
+def test_decayed_count_halves_every_half_life():
+    times = [NOW, NOW - 28 * DAY, NOW - 56 * DAY]
+    assert decayed_count(times, NOW, 28 * DAY) == pytest.approx(1 + 0.5 + 0.25)
+
+
+def test_decayed_count_ignores_future_events():
+    assert decayed_count([NOW + DAY], NOW, 28 * DAY) == 0
+
+
+def test_retention_without_size_is_max_age(make_config):
+    state = make_state(image=(8, None, [8, 18, 28], [28]))
+    assert CostPolicy(make_config()).retention("image", state, NOW) == 7 * DAY
+
+
+def test_retention_without_history_is_max_age(make_config):
+    state = State(last_used={"image": NOW})
+    assert CostPolicy(make_config()).retention("image", state, NOW) == 7 * DAY
+
+
+def test_retention_grows_with_size(make_config):
+    policy = CostPolicy(make_config())
+    small = make_state(image=(8, 50 * 10**6, [8, 18, 28], [28]))
+    large = make_state(image=(8, 5 * 10**9, [8, 18, 28], [28]))
+
+    assert 7 * DAY < policy.retention("image", small, NOW) < policy.retention("image", large, NOW)
+
+
+def test_retention_shrinks_as_uses_decay(make_config):
+    policy = CostPolicy(make_config())
+    recent = make_state(image=(8, 5 * 10**9, [8, 18, 28], [28]))
+    stale = make_state(image=(100, 5 * 10**9, [100, 110, 120], [120]))
+
+    assert policy.retention("image", stale, NOW) < policy.retention("image", recent, NOW)
+
+
+def test_select_keeps_large_regularly_used_images(make_config):
+    state = make_state(
+        large=(8, 5 * 10**9, [8, 18, 28, 38], [38]),
+        small=(8, 50 * 10**6, [8, 18, 28, 38], [38]),
+        fresh=(1, 5 * 10**6, [1], [1]),
+    )
+
+    assert AgePolicy(make_config()).select(state, NOW) == ["large", "small"]
+    assert CostPolicy(make_config()).select(state, NOW) == ["small"]
+
+
+def test_select_orders_cheapest_first(make_config):
+    state = make_state(
+        medium=(30, 500 * 10**6, [30], [30]),
+        tiny=(30, 10**6, [30], [30]),
+        unknown=(30, None, [30], [30]),
+    )
+
+    assert CostPolicy(make_config()).select(state, NOW) == ["unknown", "tiny", "medium"]
@@ -0,0 +1,59 @@
+import logging
+
+from docker_housekeep import simulate as simulate_mod
+from docker_housekeep.simulate import simulate
+
+START = 1700000000
+DAY = 86400
+SIZE = 2 * 10**9
+
+
+def record(type, action, day, image="image", size=None):
+    event = {"Type": type, "Action": action, "id": "id", "time": START + day * DAY}
+    return {"event": event, "image": image, "size": size}
+
+
+def test_use_after_eviction_is_a_repull(make_config):
+    records = [
+        record("image", "save", 0, size=SIZE),
+        record("container", "create", 10),
+    ]
+
+    result = simulate(records, make_config(), "age")
+    assert (result.evictions, result.repulls, result.repull_bytes) == (1, 1, SIZE)
+
+
+def test_recorded_deletion_is_not_a_repull(make_config):
+    records = [
+        record("container", "create", 0, size=SIZE),
+        record("image", "untag", 10),
+        record("image", "delete", 10),
+    ]
+
+    result = simulate(records, make_config(), "age")
+    assert (result.evictions, result.repulls, result.repull_bytes) == (1, 0, 0)
+
+
+def test_cost_policy_keeps_large_image_used_every_ten_days(make_config):
+    records = [record("image", "save", 0, size=SIZE)]
+    records += [record("container", "create", day) for day in range(10, 120, 10)]
+
+    age = simulate(records, make_config(), "age")
+    cost = simulate(records, make_config(), "cost")
+
+    assert age.repulls == 11
+    assert cost.repull_bytes < age.repull_bytes
+
+
+def test_replay_only_mutes_own_logs(monkeypatch, caplog, make_config):
+    def replay(records, config, policy_name):
+        logging.getLogger("host").info("host message")
+        logging.getLogger("docker_housekeep").info("replay message")
+
+    monkeypatch.setattr(simulate_mod, "_simulate", replay)
+    caplog.set_level(logging.INFO)
+
+    simulate_mod.simulate([], make_config(), "age")
+
+    assert [record.getMessage() for record in caplog.records] == ["host message"]
+    assert logging.getLogger("docker_housekeep").level == logging.NOTSET
@@ -0,0 +1,29 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from docker_housekeep.state import FileStateStorage, State
+
+STATE = State(timestamp=datetime(2024, 6, 1, tzinfo=timezone.utc), last_used={"image": datetime(2024, 6, 1)})
+
+
+def test_open_without_create_requires_existing_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        FileStateStorage.open(tmp_path / "state.json", create=False)
+
+    assert not (tmp_path / "state.json").exists()
+
+
+def test_only_first_storage_saves(tmp_path):
+    path = tmp_path / "state.json"
+    owner = FileStateStorage.open(path)
+    other = FileStateStorage.open(path, create=False)
+
+    other.save(STATE)
+    assert path.read_text(encoding="utf-8") == ""
+
+    owner.save(STATE)
+    assert other.load() == STATE
+
+    owner.close()
+    other.close()